@@ -4,11 +4,15 @@ Old World League ELO Tracker
 """
 from __future__ import annotations
 from datetime import datetime, date, timedelta
-from typing import Optional, Dict, Set, Tuple, List
-import os, base64
+from functools import lru_cache
+from typing import Optional, Dict, NamedTuple, Set, Tuple, List
+import os, re, base64
 
+import numpy as np
+import pandas as pd
 import streamlit as st
-from sqlmodel import SQLModel, Field, create_engine, Session, select
+from sqlmodel import SQLModel, Field, create_engine, Session, select, delete
+from sqlalchemy import case, func, or_, update
 from sqlalchemy.pool import NullPool
 
 # =============== Config & State ===============
@@ -25,16 +29,20 @@ LOGO_WIDTH = int(st.secrets.get("LOGO_WIDTH", os.getenv("LOGO_WIDTH", 120)))
 PLACEHOLDER_FACTIONS: List[str] = ['Empire of Man', 'Dwarfen Mountain Holds', 'Kingdom of Bretonnia', 'Wood Elf Realms', 'High Elf Realms', 'Orc & Goblin Tribes', 'Warriors of Chaos', 'Beastmen Brayheards', 'Tomb Kings of Khemri', 'Skaven', 'Ogre Kingdoms', 'Lizardmen', 'Chaos Dwarfs', 'Dark Elves', 'Daemons of Chaos', 'Vampire Counts']
 PLACEHOLDER_FACTIONS_WITH_BLANK: List[str] = ["— None —", *PLACEHOLDER_FACTIONS]
 
+# Faction -> 1-based selectbox index (0 is the blank entry)
+_FACTION_IDX = {f: i + 1 for i, f in enumerate(PLACEHOLDER_FACTIONS)}
+
+# Valid manual-pairing tokens: a player id or the literal BYE
+_PAIR_TOKEN_RE = re.compile(r"^(?:BYE|\d+)$")
+
 def _faction_index_or_blank(value: Optional[str]) -> int:
     if not value:
         return 0
-    try:
-        return 1 + PLACEHOLDER_FACTIONS.index(value)
-    except ValueError:
-        return 0
+    return _FACTION_IDX.get(value, 0)
 
 # =============== Models ===============
-SQLModel.metadata.clear()
+# No metadata.clear() here: extend_existing on each table handles script
+# reruns, and clearing would wipe the tables create_all already registered.
 
 class Player(SQLModel, table=True):
     __tablename__ = "players"
@@ -50,9 +58,9 @@ class Match(SQLModel, table=True):
     __tablename__ = "matches"
     __table_args__ = {"extend_existing": True}
     id: Optional[int] = Field(default=None, primary_key=True)
-    week: str  # DD/MM/YYYY (Wednesday of that week)
-    player_a_id: int
-    player_b_id: Optional[int] = None  # None means BYE for A
+    week: str = Field(index=True)  # DD/MM/YYYY (Wednesday of that week)
+    player_a_id: int = Field(index=True)
+    player_b_id: Optional[int] = Field(default=None, index=True)  # None means BYE for A
     result: str = "pending"  # "pending" | "a_win" | "b_win" | "draw"
     a_rating_before: Optional[float] = None
     b_rating_before: Optional[float] = None
@@ -67,8 +75,8 @@ class Attendance(SQLModel, table=True):
     __tablename__ = "attendance"
     __table_args__ = {"extend_existing": True}
     id: Optional[int] = Field(default=None, primary_key=True)
-    week: str  # DD/MM/YYYY (Wednesday id)
-    player_id: int
+    week: str = Field(index=True)  # DD/MM/YYYY (Wednesday id)
+    player_id: int = Field(index=True)
     present: bool = True
 
 class WeekKey(SQLModel, table=True):
@@ -96,6 +104,10 @@ def get_engine():
             cur = dbapi_connection.cursor()
             cur.execute("PRAGMA journal_mode=WAL;")
             cur.execute("PRAGMA synchronous=NORMAL;")
+            cur.execute("PRAGMA temp_store=MEMORY;")
+            cur.execute("PRAGMA cache_size=-65536;")  # 64 MiB page cache
+            cur.execute("PRAGMA mmap_size=268435456;")  # 256 MiB
+            cur.execute("PRAGMA busy_timeout=5000;")
             cur.close()
     except Exception:
         pass
@@ -106,36 +118,58 @@ engine = get_engine()
 @st.cache_resource
 def init_db():
     SQLModel.metadata.create_all(engine)
+    # One-shot planner stats refresh (SQLite); cheap no-op elsewhere
+    try:
+        if str(engine.url).startswith("sqlite:///"):
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA optimize;")
+    except Exception:
+        pass
     return True
 
 _ = init_db()
 
-# Run lightweight migrations only for SQLite (PRAGMA etc. are SQLite-specific)
-try:
-    if str(engine.url).startswith("sqlite:///"):
-        with engine.connect() as _conn:
-            existing = {r[0] for r in _conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
-            if "player" in existing and "players" not in existing:
-                _conn.exec_driver_sql('ALTER TABLE "player" RENAME TO "players"'); existing.add("players")
-            if "match" in existing and "matches" not in existing:
-                _conn.exec_driver_sql('ALTER TABLE "match" RENAME TO "matches"'); existing.add("matches")
-            if "weekkey" in existing and "week_keys" not in existing:
-                _conn.exec_driver_sql('ALTER TABLE "weekkey" RENAME TO "week_keys"'); existing.add("week_keys")
-            cols_players = [r[1] for r in _conn.exec_driver_sql('PRAGMA table_info("players")').fetchall()] if "players" in existing else []
-            if "active" not in cols_players and "players" in existing:
-                _conn.exec_driver_sql('ALTER TABLE "players" ADD COLUMN active BOOLEAN DEFAULT 1')
-            if "faction" not in cols_players and "players" in existing:
-                _conn.exec_driver_sql('ALTER TABLE "players" ADD COLUMN faction TEXT')
-            cols_matches = [r[1] for r in _conn.exec_driver_sql('PRAGMA table_info("matches")').fetchall()] if "matches" in existing else []
-            if "k_factor_used" not in cols_matches and "matches" in existing:
-                _conn.exec_driver_sql('ALTER TABLE "matches" ADD COLUMN k_factor_used INTEGER')
-            if "a_faction" not in cols_matches and "matches" in existing:
-                _conn.exec_driver_sql('ALTER TABLE "matches" ADD COLUMN a_faction TEXT')
-            if "b_faction" not in cols_matches and "matches" in existing:
-                _conn.exec_driver_sql('ALTER TABLE "matches" ADD COLUMN b_faction TEXT')
-            _conn.commit()
-except Exception:
-    pass
+# Run lightweight migrations only for SQLite (PRAGMA etc. are SQLite-specific);
+# gated behind st.cache_resource so reruns skip the sqlite_master/table_info probes
+@st.cache_resource(show_spinner=False)
+def run_migrations_once() -> bool:
+    try:
+        if str(engine.url).startswith("sqlite:///"):
+            with engine.connect() as _conn:
+                existing = {r[0] for r in _conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
+                if "player" in existing and "players" not in existing:
+                    _conn.exec_driver_sql('ALTER TABLE "player" RENAME TO "players"'); existing.add("players")
+                if "match" in existing and "matches" not in existing:
+                    _conn.exec_driver_sql('ALTER TABLE "match" RENAME TO "matches"'); existing.add("matches")
+                if "weekkey" in existing and "week_keys" not in existing:
+                    _conn.exec_driver_sql('ALTER TABLE "weekkey" RENAME TO "week_keys"'); existing.add("week_keys")
+                cols_players = [r[1] for r in _conn.exec_driver_sql('PRAGMA table_info("players")').fetchall()] if "players" in existing else []
+                if "active" not in cols_players and "players" in existing:
+                    _conn.exec_driver_sql('ALTER TABLE "players" ADD COLUMN active BOOLEAN DEFAULT 1')
+                if "faction" not in cols_players and "players" in existing:
+                    _conn.exec_driver_sql('ALTER TABLE "players" ADD COLUMN faction TEXT')
+                cols_matches = [r[1] for r in _conn.exec_driver_sql('PRAGMA table_info("matches")').fetchall()] if "matches" in existing else []
+                if "k_factor_used" not in cols_matches and "matches" in existing:
+                    _conn.exec_driver_sql('ALTER TABLE "matches" ADD COLUMN k_factor_used INTEGER')
+                if "a_faction" not in cols_matches and "matches" in existing:
+                    _conn.exec_driver_sql('ALTER TABLE "matches" ADD COLUMN a_faction TEXT')
+                if "b_faction" not in cols_matches and "matches" in existing:
+                    _conn.exec_driver_sql('ALTER TABLE "matches" ADD COLUMN b_faction TEXT')
+                # Indexes on hot filter columns (create_all only covers fresh tables)
+                if "matches" in existing:
+                    _conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_matches_week ON "matches" (week)')
+                    _conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_matches_player_a_id ON "matches" (player_a_id)')
+                    _conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_matches_player_b_id ON "matches" (player_b_id)')
+                    _conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_matches_week_id ON "matches" (week, id)')
+                if "attendance" in existing:
+                    _conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_attendance_week ON "attendance" (week)')
+                    _conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_attendance_player_id ON "attendance" (player_id)')
+                _conn.commit()
+    except Exception:
+        pass
+    return True
+
+_ = run_migrations_once()
 
 # =============== ELO helpers ===============
 def expected_score(rp: float, ro: float) -> float:
@@ -145,6 +179,26 @@ def update_elo(r_a: float, r_b: float, score_a: float, k: int) -> Tuple[float, f
     e_a = expected_score(r_a, r_b); e_b = expected_score(r_b, r_a)
     return r_a + k * (score_a - e_a), r_b + k * ((1 - score_a) - e_b)
 
+def batch_expected_score(r_players, r_opponents) -> np.ndarray:
+    """Vectorized expected_score over arrays of ratings."""
+    ra = np.asarray(r_players, dtype=np.float64)
+    rb = np.asarray(r_opponents, dtype=np.float64)
+    return 1.0 / (1.0 + np.power(10.0, (rb - ra) / 400.0))
+
+def batch_update_elo(r_a, r_b, scores_a, k) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized update_elo for bulk recomputation over independent matches.
+
+    Note the sequential history rebuild in recalc_all_ratings cannot use this
+    directly (each result feeds the next snapshot); it is intended for
+    what-if/bulk passes where the inputs are independent.
+    """
+    ra = np.asarray(r_a, dtype=np.float64)
+    rb = np.asarray(r_b, dtype=np.float64)
+    sa = np.asarray(scores_a, dtype=np.float64)
+    e_a = batch_expected_score(ra, rb)
+    e_b = batch_expected_score(rb, ra)
+    return ra + k * (sa - e_a), rb + k * ((1.0 - sa) - e_b)
+
 # =============== Utils ===============
 
 def _player_label(p) -> str:
@@ -173,6 +227,44 @@ def invalidate_caches():
         pass
 
 # ---- Cached fetchers (performance, non-functional) ----
+
+def _db_version() -> Tuple[int, int]:
+    """Cheap cache-invalidation token: changes whenever players or matches gain rows."""
+    with Session(engine) as s:
+        max_m = s.exec(select(func.max(Match.id))).one()
+        max_p = s.exec(select(func.max(Player.id))).one()
+    return (int(max_m or 0), int(max_p or 0))
+
+class PlayerSnap(NamedTuple):
+    id: int
+    name: str
+    rating: float
+    faction: Optional[str]
+    active: bool
+
+@st.cache_data(ttl=30, show_spinner=False)
+def cached_player_map(version: Tuple[int, int]) -> Dict[int, PlayerSnap]:
+    """Version-keyed snapshot of all players as lightweight tuples (no ORM hydration)."""
+    with Session(engine) as s:
+        rows = s.exec(select(Player.id, Player.name, Player.rating, Player.faction, Player.active)).all()
+    return {r[0]: PlayerSnap(r[0], r[1], float(r[2]), r[3], bool(r[4])) for r in rows}
+
+@st.cache_data(ttl=30, show_spinner=False)
+def active_players_snapshot(version: Tuple[int, int]) -> List[PlayerSnap]:
+    """Version-keyed snapshot of active players, ordered by name."""
+    with Session(engine) as s:
+        rows = s.exec(
+            select(Player.id, Player.name, Player.rating, Player.faction)
+            .where(Player.active == True).order_by(Player.name)
+        ).all()
+    return [PlayerSnap(r[0], r[1], float(r[2]), r[3], True) for r in rows]
+
+@st.cache_data(ttl=30, show_spinner=False)
+def player_labels_cached(version: Tuple[int, int]) -> Tuple[List[int], Dict[int, str]]:
+    """Active-player ids and display labels, built once per DB version."""
+    snaps = active_players_snapshot(version)
+    return [p.id for p in snaps], {p.id: f"{p.name} (ID {p.id}, {round(p.rating,1)})" for p in snaps}
+
 @st.cache_data(ttl=300)
 def list_players_snapshot(include_arch: bool) -> list[dict]:
     with Session(engine) as s:
@@ -184,108 +276,75 @@ def list_players_snapshot(include_arch: bool) -> list[dict]:
 
 @st.cache_data(ttl=300)
 def faction_preference_map() -> dict[int, str | None]:
-        counts: dict[int, dict[str, int]] = {}
-
-        last_seen: dict[tuple[int, str], tuple[int, int]] = {}  # (reported_at_ts, match_id) for tie-breaking
-
-
-
-        with Session(engine) as s:
-
-            matches = s.exec(select(Match)).all()
-
-            for m in matches:
-
-                # Use reported_at if available; fallback to 0. Also keep match id for deterministic fallback.
-
-                ts = int(m.reported_at.timestamp()) if getattr(m, "reported_at", None) else 0
-
-                mid = int(getattr(m, "id", 0) or 0)
-
-
-
-                if getattr(m, "a_faction", None):
-
-                    pid = m.player_a_id
-
-                    fac = m.a_faction
-
-                    counts.setdefault(pid, {}).setdefault(fac, 0)
-
-                    counts[pid][fac] += 1
-
-                    key = (pid, fac)
+    """Most-played faction per player, precomputed for everyone in one scan.
 
-                    prev = last_seen.get(key)
-
-                    if prev is None or (ts, mid) > prev:
-
-                        last_seen[key] = (ts, mid)
-
-
-
-                if m.player_b_id is not None and getattr(m, "b_faction", None):
-
-                    pid = m.player_b_id
-
-                    fac = m.b_faction
-
-                    counts.setdefault(pid, {}).setdefault(fac, 0)
-
-                    counts[pid][fac] += 1
-
-                    key = (pid, fac)
-
-                    prev = last_seen.get(key)
-
-                    if prev is None or (ts, mid) > prev:
-
-                        last_seen[key] = (ts, mid)
-
-
-
-        pref: dict[int, str | None] = {}
-
-        for pid, cdict in counts.items():
-
-            if not cdict:
-
-                pref[pid] = None
-
-            else:
-
-                # Sort by: most games desc, then most recent (reported_at desc then match id desc), then name asc
-
-                pref[pid] = sorted(
-
-                    cdict.items(),
-
-                    key=lambda kv: (
-
-                        -kv[1],
-
-                        -(last_seen.get((pid, kv[0]), (0, 0))[0]),
+    Tie-break: most games, then most recent (reported_at desc, match id desc),
+    then faction name ascending.
+    """
+    counts: dict[int, dict[str, int]] = {}
+    last_seen: dict[tuple[int, str], tuple[int, int]] = {}  # (reported_at_ts, match_id) for tie-breaking
 
-                        -(last_seen.get((pid, kv[0]), (0, 0))[1]),
+    with Session(engine) as s:
+        rows = s.exec(select(
+            Match.player_a_id, Match.a_faction,
+            Match.player_b_id, Match.b_faction,
+            Match.reported_at, Match.id,
+        )).all()
 
-                        kv[0]
+    for a_id, a_fac, b_id, b_fac, reported_at, mid in rows:
+        # Use reported_at if available; fallback to 0. Also keep match id for deterministic fallback.
+        ts = int(reported_at.timestamp()) if reported_at else 0
+        mid = int(mid or 0)
+        for pid, fac in ((a_id, a_fac), (b_id, b_fac)):
+            if pid is None or not fac:
+                continue
+            counts.setdefault(pid, {}).setdefault(fac, 0)
+            counts[pid][fac] += 1
+            key = (pid, fac)
+            prev = last_seen.get(key)
+            if prev is None or (ts, mid) > prev:
+                last_seen[key] = (ts, mid)
+
+    pref: dict[int, str | None] = {}
+    for pid, cdict in counts.items():
+        if not cdict:
+            pref[pid] = None
+            continue
+        # Sort by: most games desc, then most recent (reported_at desc then match id desc), then name asc
+        pref[pid] = sorted(
+            cdict.items(),
+            key=lambda kv: (
+                -kv[1],
+                -(last_seen.get((pid, kv[0]), (0, 0))[0]),
+                -(last_seen.get((pid, kv[0]), (0, 0))[1]),
+                kv[0]
+            )
+        )[0][0]
+    return pref
 
-                    )
 
-                )[0][0]
+# --- Cached fetchers (incremental, no UI changes) ---
 
-        return pref
+# Module-level statements: constructing these once lets SQLAlchemy's compiled
+# statement cache skip re-rendering the SQL on every rerun.
+_STMT_PLAYERS_BY_RATING = select(Player.id, Player.name, Player.rating, Player.faction).order_by(Player.rating.desc())
+_STMT_ACTIVE_PLAYERS_BY_RATING = _STMT_PLAYERS_BY_RATING.where(Player.active == True)
 
+_MATCH_HISTORY_COLS = (
+    Match.id, Match.week, Match.player_a_id, Match.a_faction,
+    Match.player_b_id, Match.b_faction, Match.result, Match.k_factor_used,
+    Match.a_rating_before, Match.b_rating_before, Match.a_rating_after, Match.b_rating_after,
+)
 
-# --- Cached fetchers (incremental, no UI changes) ---
 @st.cache_data(ttl=60, show_spinner=False)
-def list_matches_recent() -> list[Match]:
-    with Session(engine) as s:
-        try:
-            q = select(Match).order_by(Match.reported_at.desc(), Match.id.desc())
-        except Exception:
-            q = select(Match).order_by(Match.week.desc(), Match.id.desc())
-        return s.exec(q).all()
+def matches_history_df() -> pd.DataFrame:
+    # One SQL query straight into a DataFrame: column materialization and
+    # rounding happen vectorized instead of per-row dict building.
+    try:
+        q = select(*_MATCH_HISTORY_COLS).order_by(Match.reported_at.desc(), Match.id.desc())
+    except Exception:
+        q = select(*_MATCH_HISTORY_COLS).order_by(Match.week.desc(), Match.id.desc())
+    return pd.read_sql(q, engine)
 
 @st.cache_data(ttl=60, show_spinner=False)
 def list_week_matches(week: str) -> list[Match]:
@@ -376,20 +435,31 @@ def recalc_all_ratings(engine) -> None:
 
         s.commit()
 
-def most_played_faction(session: Session, player_id: int) -> Optional[str]:
-    counts: Dict[str, int] = {}
-    # Count appearances as A
-    for m in session.exec(select(Match).where(Match.player_a_id == player_id)).all():
-        if getattr(m, "a_faction", None):
-            counts[m.a_faction] = counts.get(m.a_faction, 0) + 1
-    # Count appearances as B
-    for m in session.exec(select(Match).where(Match.player_b_id == player_id)).all():
-        if getattr(m, "b_faction", None):
-            counts[m.b_faction] = counts.get(m.b_faction, 0) + 1
-    if not counts:
-        return None
+def most_played_factions(session: Session, player_ids: List[int]) -> Dict[int, Optional[str]]:
+    """Most-played faction for a set of players in two grouped queries."""
+    counts: Dict[int, Dict[str, int]] = {pid: {} for pid in player_ids}
+    # Appearances as A (aggregated in SQL, no row transfer)
+    for pid, fac, n in session.exec(
+        select(Match.player_a_id, Match.a_faction, func.count())
+        .where(Match.player_a_id.in_(player_ids), Match.a_faction.is_not(None))
+        .group_by(Match.player_a_id, Match.a_faction)
+    ).all():
+        counts[pid][fac] = counts[pid].get(fac, 0) + n
+    # Appearances as B
+    for pid, fac, n in session.exec(
+        select(Match.player_b_id, Match.b_faction, func.count())
+        .where(Match.player_b_id.in_(player_ids), Match.b_faction.is_not(None))
+        .group_by(Match.player_b_id, Match.b_faction)
+    ).all():
+        counts[pid][fac] = counts[pid].get(fac, 0) + n
     # Deterministic tie-break: highest count, then alphabetical
-    return sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[0][0]
+    return {
+        pid: (sorted(c.items(), key=lambda kv: (-kv[1], kv[0]))[0][0] if c else None)
+        for pid, c in counts.items()
+    }
+
+def most_played_faction(session: Session, player_id: int) -> Optional[str]:
+    return most_played_factions(session, [player_id])[player_id]
 
 
 # =============== Week password utility ===============
@@ -397,9 +467,11 @@ def week_password(session: Session, week: str) -> Optional[str]:
     row = session.exec(select(WeekKey).where(WeekKey.week == week)).first()
     return row.results_password if row else None
 
+@lru_cache(maxsize=64)
 def uk_date_str(d: date) -> str:
     return d.strftime("%d/%m/%Y")
 
+@lru_cache(maxsize=64)
 def week_id_wed(d: date) -> str:
     # Monday=0 ... Sunday=6; Wednesday is 2
     offset = 2 - d.weekday()
@@ -415,9 +487,37 @@ def cached_player_record(player_id: int):
 def get_player_map(session: Session) -> Dict[int, Player]:
     return {p.id: p for p in session.exec(select(Player)).all()}
 
+@st.cache_data(ttl=60, show_spinner=False)
+def player_records_all() -> dict[int, tuple[int, int, int]]:
+    """Return {player_id: (wins, draws, losses)} for every player in one pass.
+
+    Issues a single column-only SELECT over matches instead of one query per
+    player; BYE/pending handling mirrors player_record.
+    """
+    counts: dict[int, list[int]] = {}
+    with Session(engine) as s:
+        rows = s.exec(select(Match.player_a_id, Match.player_b_id, Match.result)).all()
+    for a_id, b_id, result in rows:
+        if result == "pending":
+            continue
+        rec_a = counts.setdefault(a_id, [0, 0, 0])
+        if b_id is None:
+            rec_a[0] += 1  # policy: count BYE as W
+            continue
+        rec_b = counts.setdefault(b_id, [0, 0, 0])
+        if result == "draw":
+            rec_a[1] += 1; rec_b[1] += 1
+        elif result == "a_win":
+            rec_a[0] += 1; rec_b[2] += 1
+        elif result == "b_win":
+            rec_b[0] += 1; rec_a[2] += 1
+    return {pid: (w, d, l) for pid, (w, d, l) in counts.items()}
+
 def player_record(session: Session, player_id: int):
     """Return (wins, draws, losses) for a player.
     BYE currently counts as a win for A (no rating change).
+    Deprecated for leaderboard use: prefer player_records_all(), which
+    computes every player's record in a single query.
     """
     w = d = l = 0
     matches: List[Match] = session.exec(
@@ -441,39 +541,54 @@ def player_record(session: Session, player_id: int):
             else: l += 1
     return w, d, l
 
-def fetch_past_pairs(session: Session) -> Set[tuple[int, int]]:
-    s: Set[tuple[int, int]] = set()
-    for m in session.exec(select(Match)).all():
-        if m.player_b_id is None: continue
-        a, b = sorted([m.player_a_id, m.player_b_id]); s.add((a, b))
-    return s
+def fetch_past_pairs(session: Session) -> frozenset[int]:
+    """Return past pairs packed as (min_id << 32) | max_id.
+
+    Integer keys hash faster than tuples and avoid the per-probe tuple
+    allocation in the pairing loop.
+    """
+    return frozenset(
+        (a << 32) | b if a < b else (b << 32) | a
+        for a, b in session.exec(
+            select(Match.player_a_id, Match.player_b_id).where(Match.player_b_id.is_not(None))
+        ).all()
+    )
 
 def generate_weekly_pairings(session: Session, week: str, restrict_to: Optional[Set[int]] = None):
     q = select(Player).where(Player.active == True).order_by(Player.rating.desc())
     players = session.exec(q).all(); ids = [p.id for p in players]
     if restrict_to: ids = [i for i in ids if i in restrict_to]
     if not ids: return []
-    past = fetch_past_pairs(session); used: Set[int] = set(); pairings = []
+    # Unpack the packed pair keys into per-player opponent sets so the
+    # repeat check inside the scan is a plain set lookup
+    prev_opps: Dict[int, Set[int]] = {}
+    for key in fetch_past_pairs(session):
+        a, b = key >> 32, key & 0xFFFFFFFF
+        prev_opps.setdefault(a, set()).add(b)
+        prev_opps.setdefault(b, set()).add(a)
+    n = len(ids); available = [True] * n; pairings = []
     for i, pid in enumerate(ids):
-        if pid in used: continue
-        opp = None
-        # Prefer non-repeat vs nearest down the list
-        for j in range(i + 1, len(ids)):
-            cand = ids[j]
-            if cand in used: continue
-            if tuple(sorted([pid, cand])) not in past:
-                opp = cand; break
-        if opp is None:
-            for j in range(i + 1, len(ids)):
-                cand = ids[j]
-                if cand in used: continue
-                opp = cand; break
-        if opp is None: pairings.append((pid, None)); used.add(pid)
-        else: pairings.append((pid, opp)); used.update([pid, opp])
-    created = []
-    for a, b in pairings:
-        m = Match(week=week, player_a_id=a, player_b_id=b, result="pending")
-        session.add(m); session.commit(); session.refresh(m); created.append(m)
+        if not available[i]: continue
+        available[i] = False
+        seen = prev_opps.get(pid, ())
+        # Single pass: prefer the nearest non-repeat down the list, but
+        # remember the first available candidate as the rematch fallback
+        opp_j = None; fallback_j = None
+        for j in range(i + 1, n):
+            if not available[j]: continue
+            if fallback_j is None: fallback_j = j
+            if ids[j] not in seen:
+                opp_j = j; break
+        if opp_j is None: opp_j = fallback_j
+        if opp_j is None: pairings.append((pid, None))
+        else:
+            available[opp_j] = False
+            pairings.append((pid, ids[opp_j]))
+    created = [Match(week=week, player_a_id=a, player_b_id=b, result="pending") for a, b in pairings]
+    session.add_all(created)
+    session.commit()
+    for m in created:
+        session.refresh(m)
     return created
 
 # =============== Theme (sticky header + spacing) ===============
@@ -497,18 +612,26 @@ def _find_logo_path() -> Optional[str]:
         if os.path.exists(p): return p
     return None
 
+@st.cache_resource(show_spinner=False)
+def _logo_data_url() -> Optional[str]:
+    # Encode once per process; reruns reuse the cached data URL
+    lp = _find_logo_path()
+    if not lp:
+        return None
+    with open(lp, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode()
+    ext = lp.lower().split(".")[-1]
+    mime = "image/png" if ext == "png" else "image/jpeg"
+    return f"data:{mime};base64,{encoded}"
+
 def render_header():
     logo_html = ""
     if LOGO_URL:
         logo_html = f"<img src='{LOGO_URL}' alt='Old World Logo' width='{LOGO_WIDTH}'/>"
     else:
-        lp = _find_logo_path();
-        if lp:
-            with open(lp, "rb") as f:
-                encoded = base64.b64encode(f.read()).decode()
-            ext = lp.lower().split(".")[-1]
-            mime = "image/png" if ext == "png" else "image/jpeg"
-            logo_html = f"<img src='data:{mime};base64,{encoded}' alt='Old World Logo' width='{LOGO_WIDTH}'/>"
+        data_url = _logo_data_url()
+        if data_url:
+            logo_html = f"<img src='{data_url}' alt='Old World Logo' width='{LOGO_WIDTH}'/>"
     header_html = f"""
 <div class='owl-header' style='display:flex;flex-direction:column;align-items:center;gap:.35rem;margin:1.0rem 0 .6rem;'>
   {logo_html}
@@ -529,8 +652,20 @@ def _encode_local_image_if_exists(names) -> Optional[str]:
             with open(p, "rb") as f: return base64.b64encode(f.read()).decode()
     return None
 
+@st.cache_resource(show_spinner=False)
+def _sponsor_base64() -> Optional[str]:
+    return _encode_local_image_if_exists(_SPONSOR_NAMES)
+
+@st.cache_resource(show_spinner=False)
+def _discord_base64() -> Optional[str]:
+    try:
+        with open("discord.png", "rb") as f:
+            return base64.b64encode(f.read()).decode()
+    except FileNotFoundError:
+        return None
+
 def sidebar_sponsor():
-    enc = _encode_local_image_if_exists(_SPONSOR_NAMES)
+    enc = _sponsor_base64()
     if enc:
         html = f"""
 <div style='text-align:center; margin-top:1.5rem;'>
@@ -543,9 +678,8 @@ def sidebar_sponsor():
         st.markdown(html, unsafe_allow_html=True)
     else:
         st.markdown("[Element Games: North West Gaming Centre](https://elementgames.co.uk/north-west-gaming-centre)")
-    try:
-        with open("discord.png", "rb") as f:
-            discord_encoded = base64.b64encode(f.read()).decode()
+    discord_encoded = _discord_base64()
+    if discord_encoded:
         discord_html = f"""
 <div style='text-align:center; margin-top:1.5rem;'>
   <a href='https://discord.gg/fJeE8NHeyg' target='_blank'>
@@ -554,7 +688,7 @@ def sidebar_sponsor():
 </div>
 """
         st.markdown(discord_html, unsafe_allow_html=True)
-    except FileNotFoundError:
+    else:
         st.markdown("[Join us on Discord](https://discord.gg/fJeE8NHeyg)")
 
 # =============== Boot ===============
@@ -572,6 +706,22 @@ if st.session_state.get("is_admin"):
         except Exception as _e:
             st.sidebar.error("Recalculation failed. See logs for details.")
 # =============== Sidebar: Access & backup + sponsor ===============
+
+@st.cache_data(show_spinner=False)
+def _db_download_bytes(mtime: float) -> bytes:
+    """Snapshot of the SQLite file, keyed by mtime so unchanged files are read once.
+
+    Checkpoints the WAL first so the downloaded copy is self-consistent.
+    """
+    try:
+        if str(engine.url).startswith("sqlite:///"):
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE);")
+    except Exception:
+        pass
+    with open(DB_PATH, "rb") as f:
+        return f.read()
+
 with st.sidebar:
     st.header("Access")
     if not st.session_state.is_admin:
@@ -592,7 +742,7 @@ with st.sidebar:
             st.rerun()
         try:
             if os.path.exists(DB_PATH):
-                with open(DB_PATH, "rb") as f: data = f.read()
+                data = _db_download_bytes(os.path.getmtime(DB_PATH))
                 st.download_button("Download DB", data=data, file_name=DB_PATH, mime="application/octet-stream", use_container_width=True)
         except Exception:
             pass
@@ -608,6 +758,35 @@ T = st.tabs(order)
 # =============== Leaderboard ===============
 
 # --- Fast-path: fetch W/D/L via DB function (fallback to local) ---
+@st.cache_data(ttl=60, show_spinner=False)
+def _wdl_map_sql() -> dict[int, tuple[int,int,int]]:
+    """Return {player_id: (wins, draws, losses)} aggregated inside the database.
+
+    Two UNION ALL arms (one per side) keep the player_a_id/player_b_id
+    indexes usable; only one (pid, w, d, l) row per player crosses the wire.
+    BYE counts as a win for A, pending matches are ignored.
+    """
+    from sqlalchemy import text as _sqltext
+    sql = _sqltext("""
+        SELECT pid, SUM(w) AS w, SUM(d) AS d, SUM(l) AS l FROM (
+            SELECT player_a_id AS pid,
+                   SUM(CASE WHEN player_b_id IS NULL OR result = 'a_win' THEN 1 ELSE 0 END) AS w,
+                   SUM(CASE WHEN player_b_id IS NOT NULL AND result = 'draw' THEN 1 ELSE 0 END) AS d,
+                   SUM(CASE WHEN player_b_id IS NOT NULL AND result = 'b_win' THEN 1 ELSE 0 END) AS l
+            FROM matches WHERE result != 'pending' GROUP BY player_a_id
+            UNION ALL
+            SELECT player_b_id AS pid,
+                   SUM(CASE WHEN result = 'b_win' THEN 1 ELSE 0 END) AS w,
+                   SUM(CASE WHEN result = 'draw' THEN 1 ELSE 0 END) AS d,
+                   SUM(CASE WHEN result = 'a_win' THEN 1 ELSE 0 END) AS l
+            FROM matches WHERE result != 'pending' AND player_b_id IS NOT NULL GROUP BY player_b_id
+        ) AS per_side GROUP BY pid
+    """)
+    with Session(engine) as s:
+        rows = s.exec(sql).all()
+    return {int(r[0]): (int(r[1] or 0), int(r[2] or 0), int(r[3] or 0)) for r in rows}
+
+
 @st.cache_data(ttl=60, show_spinner=False)
 def _wdl_map_via_db() -> dict[int, tuple[int,int,int]]:
     """Return {player_id: (wins, draws, losses)} using SQL function public.player_wdl().
@@ -633,7 +812,13 @@ def _wdl_map_via_db() -> dict[int, tuple[int,int,int]]:
         pass
     # Fallbacks identical to previous behavior
     try:
-        return player_records_all()  # if present
+        out = _wdl_map_sql()
+        if out:
+            return out
+    except Exception:
+        pass
+    try:
+        return player_records_all()
     except Exception:
         pass
     try:
@@ -680,10 +865,8 @@ with T[idx["Leaderboard"]]:
     st.subheader("Leaderboard")
     show_archived = st.checkbox("Include archived players", value=False, key="lb_arch")
     with Session(engine) as s:
-        q = select(Player)
-        if not show_archived:
-            q = q.where(Player.active == True)
-        players = s.exec(q.order_by(Player.rating.desc())).all()
+        q = _STMT_PLAYERS_BY_RATING if show_archived else _STMT_ACTIVE_PLAYERS_BY_RATING
+        players = s.exec(q).all()
         rows_lead = _fetch_leaderboard_rows()
         if rows_lead:
             records = {r["id"]: (r["wins"], r["draws"], r["losses"]) for r in rows_lead}
@@ -735,27 +918,34 @@ except Exception:
     pass
 with T[idx["Data"]]:
     st.subheader("History")
-    with Session(engine) as s:
-        matches = list_matches_recent()
-        names = player_name_map_cached()
-        pref_map = faction_preference_map()
+    # All three fetchers are cached; no session needed on this path
+    df_hist = matches_history_df()
+    names = player_name_map_cached()
+    pref_map = faction_preference_map()
 
-    if matches:
-        rows = [{
-            "Match ID": m.id,
-            "Week": m.week,
-            "A": names.get(m.player_a_id, f"A#{m.player_a_id}"),
-            "Faction A": m.a_faction,
-            "B": (names.get(m.player_b_id, f"B#{m.player_b_id}") if m.player_b_id else "BYE"),
-            "Faction B": m.b_faction,
-            "Result": m.result,
-            "K Used": m.k_factor_used,
-            "A Before": (round(m.a_rating_before,1) if m.a_rating_before is not None else None),
-            "B Before": (round(m.b_rating_before,1) if m.b_rating_before is not None else None),
-            "A After": (round(m.a_rating_after,1) if m.a_rating_after is not None else None),
-            "B After": (round(m.b_rating_after,1) if m.b_rating_after is not None else None)
-        } for m in matches]
-        st.dataframe(rows, use_container_width=True, hide_index=True, column_config={"Rating": st.column_config.NumberColumn(format="%.1f"), "GP": st.column_config.NumberColumn(format="%d"), "W": st.column_config.NumberColumn(format="%d"), "D": st.column_config.NumberColumn(format="%d"), "L": st.column_config.NumberColumn(format="%d")})
+    if not df_hist.empty:
+        a_names = df_hist["player_a_id"].map(names).fillna("A#" + df_hist["player_a_id"].astype(str))
+        b_names = (
+            df_hist["player_b_id"].map(names)
+            .fillna("B#" + df_hist["player_b_id"].astype("Int64").astype(str))
+            .where(df_hist["player_b_id"].notna(), "BYE")
+        )
+        hist = pd.DataFrame({
+            "Match ID": df_hist["id"],
+            "Week": df_hist["week"],
+            "A": a_names,
+            "Faction A": df_hist["a_faction"],
+            "B": b_names,
+            "Faction B": df_hist["b_faction"],
+            "Result": df_hist["result"],
+            "K Used": df_hist["k_factor_used"],
+            # All-NULL rating columns come back as object dtype; coerce first
+            "A Before": pd.to_numeric(df_hist["a_rating_before"]).round(1),
+            "B Before": pd.to_numeric(df_hist["b_rating_before"]).round(1),
+            "A After": pd.to_numeric(df_hist["a_rating_after"]).round(1),
+            "B After": pd.to_numeric(df_hist["b_rating_after"]).round(1),
+        })
+        st.dataframe(hist, use_container_width=True, hide_index=True, column_config={"Rating": st.column_config.NumberColumn(format="%.1f"), "GP": st.column_config.NumberColumn(format="%d"), "W": st.column_config.NumberColumn(format="%d"), "D": st.column_config.NumberColumn(format="%d"), "L": st.column_config.NumberColumn(format="%d")})
     else: st.info("No matches recorded yet.")
 
 # =============== Week password helpers ===============
@@ -792,9 +982,8 @@ with T[idx["Enter Results"]]:
         if st.button("Unlock week", key=f"btn_unlock:::{week_val}"): st.session_state[wk_key] = (pw_try == wk_pw); st.success("Unlocked." if st.session_state[wk_key] else "Incorrect password.")
     locked = wk_pw and (not st.session_state[wk_key])
 
-    with Session(engine) as s:
-        matches = list_week_matches(week_val)
-        pmap = get_player_map(s)
+    matches = list_week_matches(week_val)
+    pmap = cached_player_map(_db_version())
 
     pref_map = faction_preference_map()
     if locked: st.info("Week is locked. Enter the password to submit results.")
@@ -824,16 +1013,26 @@ with T[idx["Enter Results"]]:
                         if not match or match.result != "pending": st.error("Match not found or already recorded.")
                         else:
                             pa = s2.get(Player, match.player_a_id); pb = s2.get(Player, match.player_b_id) if match.player_b_id is not None else None
-                            match.a_rating_before = pa.rating; match.b_rating_before = pb.rating if pb else None
                             if pb is None:
-                                match.result = "a_win"; match.a_rating_after = pa.rating; match.k_factor_used = None; match.reported_at = datetime.utcnow()
-                                match.a_faction = a_faction; match.b_faction = None
-                                s2.add(match); s2.commit(); invalidate_caches(); st.success("BYE recorded (no rating change).")
+                                s2.exec(update(Match).where(Match.id == match.id).values(
+                                    result="a_win", a_rating_before=pa.rating, b_rating_before=None,
+                                    a_rating_after=pa.rating, k_factor_used=None, reported_at=datetime.utcnow(),
+                                    a_faction=a_faction, b_faction=None))
+                                s2.commit(); invalidate_caches(); st.success("BYE recorded (no rating change).")
                             else:
                                 k = 10 if k_choice.startswith("Casual") else 40; score_a = 1.0 if result == "a_win" else 0.0 if result == "b_win" else 0.5
-                                new_a, new_b = update_elo(pa.rating, pb.rating, score_a, k)
-                                match.result = result; match.a_rating_after = new_a; match.b_rating_after = new_b; match.k_factor_used = int(k); match.reported_at = datetime.utcnow(); match.a_faction = a_faction; match.b_faction = b_faction
-                                pa.rating = new_a; pb.rating = new_b; s2.add(pa); s2.add(pb); s2.add(match); s2.commit(); invalidate_caches(); st.success(f"Saved result (K={k}).")
+                                # Capture before the Player UPDATE: session sync
+                                # would overwrite pa/pb.rating with the new values
+                                before_a, before_b = pa.rating, pb.rating
+                                new_a, new_b = update_elo(before_a, before_b, score_a, k)
+                                # Two Core UPDATEs (one per table) instead of three ORM flushes
+                                s2.exec(update(Player).where(Player.id.in_([pa.id, pb.id])).values(
+                                    rating=case((Player.id == pa.id, new_a), else_=new_b)))
+                                s2.exec(update(Match).where(Match.id == match.id).values(
+                                    result=result, a_rating_before=before_a, b_rating_before=before_b,
+                                    a_rating_after=new_a, b_rating_after=new_b, k_factor_used=int(k),
+                                    reported_at=datetime.utcnow(), a_faction=a_faction, b_faction=b_faction))
+                                s2.commit(); invalidate_caches(); st.success(f"Saved result (K={k}).")
 
 # =============== Players (admin) ===============
 if st.session_state.get("is_admin", False) and "Players" in idx:
@@ -855,7 +1054,7 @@ if st.session_state.get("is_admin", False) and "Players" in idx:
         st.divider(); st.subheader("Current Players")
         with Session(engine) as s:
             show_arch = st.checkbox("Show archived players", value=False, key="pl_arch")
-            q = select(Player)
+            q = select(Player.id, Player.name, Player.rating, Player.faction, Player.active, Player.created_at)
             if not show_arch: q = q.where(Player.active == True)
             players = s.exec(q.order_by(Player.rating.desc())).all()
         if players:
@@ -874,7 +1073,6 @@ if st.session_state.get("is_admin", False) and "Players" in idx:
                 labels = [f"{p.name} (ID {p.id})" for p in all_players]
                 id_by_label = {labels[i]: all_players[i].id for i in range(len(all_players))}
                 pref_map = faction_preference_map()
-                pref_map = faction_preference_map()
                 chosen = st.selectbox("Select a player", labels, key="edit_faction_player")
                 pid = id_by_label[chosen]
                 with Session(engine) as s:
@@ -924,10 +1122,8 @@ if st.session_state.get("is_admin", False) and "Players" in idx:
                 sel_label = st.selectbox("Select player to delete", list(del_map.keys()), key="del_player_sel")
                 sel_id = del_map[sel_label]
                 with Session(engine) as s:
-                    m_count = s.exec(select(Match).where((Match.player_a_id == sel_id) | (Match.player_b_id == sel_id))).all()
-                    a_count = s.exec(select(Attendance).where(Attendance.player_id == sel_id)).all()
-                    matches_num = len(m_count)
-                    attend_num = len(a_count)
+                    matches_num = s.exec(select(func.count()).select_from(Match).where((Match.player_a_id == sel_id) | (Match.player_b_id == sel_id))).one()
+                    attend_num = s.exec(select(func.count()).select_from(Attendance).where(Attendance.player_id == sel_id)).one()
                 st.write(f"Related records — Matches: **{matches_num}**, Attendance: **{attend_num}**.")
                 with st.form("delete_player_now_form", clear_on_submit=False):
                     col_del1, col_del2 = st.columns([1,2])
@@ -942,14 +1138,12 @@ if st.session_state.get("is_admin", False) and "Players" in idx:
                     else:
                         with Session(engine) as s:
                             if hard_delete:
-                                for mm in s.exec(select(Match).where((Match.player_a_id == sel_id) | (Match.player_b_id == sel_id))).all():
-                                    s.delete(mm)
-                                for aa in s.exec(select(Attendance).where(Attendance.player_id == sel_id)).all():
-                                    s.delete(aa)
+                                s.exec(delete(Match).where(or_(Match.player_a_id == sel_id, Match.player_b_id == sel_id)))
+                                s.exec(delete(Attendance).where(Attendance.player_id == sel_id))
                                 s.commit()
                             else:
-                                m_exists = s.exec(select(Match).where((Match.player_a_id == sel_id) | (Match.player_b_id == sel_id))).first()
-                                a_exists = s.exec(select(Attendance).where(Attendance.player_id == sel_id)).first()
+                                m_exists = s.exec(select(Match.id).where((Match.player_a_id == sel_id) | (Match.player_b_id == sel_id)).limit(1)).first()
+                                a_exists = s.exec(select(Attendance.id).where(Attendance.player_id == sel_id).limit(1)).first()
                                 if m_exists or a_exists:
                                     st.error("Player has related matches/attendance. Tick the checkbox to delete them too, or archive instead."); st.stop()
                             pl = s.get(Player, sel_id)
@@ -961,51 +1155,51 @@ if st.session_state.get("is_admin", False) and "Players" in idx:
 
 # =============== Pairings (admin) ===============
 if st.session_state.get("is_admin", False) and "Pairings" in idx:
-    with T[idx["Pairings"]]:
-        st.subheader("Generate Pairings")
-        c1, c2, c3 = st.columns(3)
-        with c1:
-            st.caption("Week ID uses the **Wednesday** of the week (DD/MM/YYYY).")
-        with st.form("pairings_generate_form", clear_on_submit=False):
-            c2, c3 = st.columns([2,1])
-            with c2:
-                week_str = st.text_input("Week id", value=week_id_wed(date.today()))
-            with c3:
-                generate = st.form_submit_button("Generate pairings")
-        # Inline reset controls for the same week (tidier UI)
+    @st.fragment
+    def _pairings_fragment() -> None:
+        """Admin pairings UI; widget input reruns only this fragment."""
+        # One session for the whole tab; handlers commit as they go
         with Session(engine) as s:
-            _ms = s.exec(select(Match).where(Match.week == week_str)).all()
-        _total = len(_ms); _pending = sum(1 for m in _ms if m.result == "pending"); _reported = _total - _pending
-        st.caption(f"{week_str}: {_total} matches ({_pending} pending, {_reported} reported)")
-        colr1, colr2 = st.columns([1,2])
-        with colr1:
-            include_reported = st.checkbox("Also delete reported (irrevocable)", value=False, key="reset_include_reported")
-        with colr2:
-            with st.form("reset_pairings_form", clear_on_submit=False):
-                do_reset = st.form_submit_button("Reset pairings for this week")
-            if do_reset:
-                with Session(engine) as s:
-                    ms = s.exec(select(Match).where(Match.week == week_str)).all()
-                    for m in ms:
-                        if include_reported or m.result == "pending":
-                            s.delete(m)
+            st.subheader("Generate Pairings")
+            c1, c2, c3 = st.columns(3)
+            with c1:
+                st.caption("Week ID uses the **Wednesday** of the week (DD/MM/YYYY).")
+            with st.form("pairings_generate_form", clear_on_submit=False):
+                c2, c3 = st.columns([2,1])
+                with c2:
+                    week_str = st.text_input("Week id", value=week_id_wed(date.today()))
+                with c3:
+                    generate = st.form_submit_button("Generate pairings")
+            # Inline reset controls for the same week (tidier UI)
+            _counts = dict(s.exec(select(Match.result, func.count()).where(Match.week == week_str).group_by(Match.result)).all())
+            _total = sum(_counts.values()); _pending = _counts.get("pending", 0); _reported = _total - _pending
+            st.caption(f"{week_str}: {_total} matches ({_pending} pending, {_reported} reported)")
+            colr1, colr2 = st.columns([1,2])
+            with colr1:
+                include_reported = st.checkbox("Also delete reported (irrevocable)", value=False, key="reset_include_reported")
+            with colr2:
+                with st.form("reset_pairings_form", clear_on_submit=False):
+                    do_reset = st.form_submit_button("Reset pairings for this week")
+                if do_reset:
+                    q = delete(Match).where(Match.week == week_str)
+                    if not include_reported:
+                        q = q.where(Match.result == "pending")
+                    s.exec(q)
                     s.commit()
-                invalidate_caches()
-                st.success("Deleted matches. Use 'Generate pairings' to recreate."); st.rerun()
+                    invalidate_caches()
+                    st.success("Deleted matches. Use 'Generate pairings' to recreate."); st.rerun()
 
-        # Week results password (compact)
-        with Session(engine) as s:
+            # Week results password (compact)
             existing_pw = week_password(s, week_str)
-        with st.expander("Week results password", expanded=False):
-            st.caption("Lock this week's result submissions behind a password.")
-            with st.form('week_password_form'):
-                pw_new = st.text_input("New password", type="password")
-                set_pw = st.form_submit_button("Set / Update password")
-                clear_pw = st.form_submit_button("Clear password")
-            cols_pw = st.columns([1,1,1])
-            with cols_pw[0]:
-                if set_pw:
-                    with Session(engine) as s:
+            with st.expander("Week results password", expanded=False):
+                st.caption("Lock this week's result submissions behind a password.")
+                with st.form('week_password_form'):
+                    pw_new = st.text_input("New password", type="password")
+                    set_pw = st.form_submit_button("Set / Update password")
+                    clear_pw = st.form_submit_button("Clear password")
+                cols_pw = st.columns([1,1,1])
+                with cols_pw[0]:
+                    if set_pw:
                         try:
                             _val = (pw_new or "").strip()
                             if _val:
@@ -1016,134 +1210,148 @@ if st.session_state.get("is_admin", False) and "Pairings" in idx:
                                 invalidate_caches(); st.success("Password cleared.")
                         except Exception as e:
                             st.error(f"Error updating password: {e}")
-            with cols_pw[1]:
-                if clear_pw:
-                    with Session(engine) as s:
+                with cols_pw[1]:
+                    if clear_pw:
                         clear_week_password(s, week_str)
-                    invalidate_caches(); st.success("Password cleared.")
-            with cols_pw[2]:
-                st.metric("Current status", "Set" if existing_pw else "Not set")
-
-
-        st.divider(); st.subheader("Weekly attendance")
-        with Session(engine) as s:
-            active_players = s.exec(select(Player).where(Player.active == True).order_by(Player.name)).all()
-            already_present = {r.player_id for r in s.exec(select(Attendance).where(Attendance.week == week_str)).all() if r.present}
-        labels = [f"{p.name} (ID {p.id}, {round(p.rating,1)})" for p in active_players]
-        map_id = {labels[i]: active_players[i].id for i in range(len(active_players))}
-        defaults = [lbl for lbl in labels if map_id[lbl] in already_present]
-        with st.form('attendance_form'):
-            sel = st.multiselect("Players present this week", labels, default=defaults)
-            selected_ids = {map_id[lbl] for lbl in sel}
-            save_att = st.form_submit_button("Save attendance")
-            clear_att = st.form_submit_button("Clear attendance")
-        a1, a2 = st.columns(2)
-        with a1:
-            if save_att:
-                with Session(engine) as s:
-                    existing = s.exec(select(Attendance).where(Attendance.week == week_str)).all()
-                    for r in existing: s.delete(r)
-                    for pid in selected_ids: s.add(Attendance(week=week_str, player_id=pid, present=True))
+                        invalidate_caches(); st.success("Password cleared.")
+                with cols_pw[2]:
+                    st.metric("Current status", "Set" if existing_pw else "Not set")
+
+
+            st.divider(); st.subheader("Weekly attendance")
+            # Cached ids/labels; only this week's attendance hits the DB per rerun
+            _att_options, _att_labels = player_labels_cached(_db_version())
+            already_present = set(s.exec(
+                select(Attendance.player_id).where(Attendance.week == week_str, Attendance.present == True)
+            ).all())
+            with st.form('attendance_form'):
+                sel = st.multiselect(
+                    "Players present this week", _att_options,
+                    default=[pid for pid in _att_options if pid in already_present],
+                    format_func=_att_labels.__getitem__,
+                )
+                selected_ids = set(sel)
+                save_att = st.form_submit_button("Save attendance")
+                clear_att = st.form_submit_button("Clear attendance")
+            a1, a2 = st.columns(2)
+            with a1:
+                if save_att:
+                    s.exec(delete(Attendance).where(Attendance.week == week_str))
+                    s.add_all([Attendance(week=week_str, player_id=pid, present=True) for pid in selected_ids])
                     s.commit(); invalidate_caches(); st.success("Attendance saved.")
-        with a2:
-            if clear_att:
-                with Session(engine) as s:
-                    existing = s.exec(select(Attendance).where(Attendance.week == week_str)).all()
-                    for r in existing: s.delete(r)
+            with a2:
+                if clear_att:
+                    s.exec(delete(Attendance).where(Attendance.week == week_str))
                     s.commit(); invalidate_caches(); st.success("Attendance cleared.")
 
-        if generate:
-            with Session(engine) as s:
-                existing = s.exec(select(Match).where(Match.week == week_str)).all()
-                if existing: st.error(f"Pairings already exist for {week_str} ({len(existing)}). Reset above to redo.")
+            if generate:
+                existing = s.exec(select(func.count()).select_from(Match).where(Match.week == week_str)).one()
+                if existing: st.error(f"Pairings already exist for {week_str} ({existing}). Reset above to redo.")
                 else:
-                    attendance_ids = {r.player_id for r in s.exec(select(Attendance).where(Attendance.week == week_str)).all() if r.present}
+                    # Attendance is already in scope from the widget above; a
+                    # save on this rerun supersedes what was loaded
+                    attendance_ids = selected_ids if save_att else already_present
                     restrict = attendance_ids if attendance_ids else None
                     created = generate_weekly_pairings(s, week_str, restrict_to=restrict)
                     invalidate_caches()
                     st.success(f"Created {len(created)} matches." if created else "No players to pair.")
 
-        st.divider(); st.subheader("Weekly Pairings")
-        lookup = st.text_input("Look up week (DD/MM/YYYY)", value=week_str, key="lookup_pair")
-        with Session(engine) as s:
-            all_matches = s.exec(select(Match).where(Match.week == lookup).order_by(Match.id)).all(); pmap = get_player_map(s)
-        pending_matches = [m for m in all_matches if m.result == "pending"]
-        if pending_matches:
-            rows = [{"Match ID": m.id, "A": f"{pmap[m.player_a_id].name} (#{m.player_a_id})", "B": (f"{pmap[m.player_b_id].name} (#{m.player_b_id})" if m.player_b_id else "BYE"), "Result": m.result} for m in pending_matches]
-            st.dataframe(rows, use_container_width=True, hide_index=True)
-
-            # Inline delete control for no-shows
-            st.caption("Remove no-show pairings below. By default, only pending matches can be deleted.")
-            allow_reported_delete = st.checkbox("Allow deleting reported results (dangerous)", value=False, key="del_allow_reported_inline")
-            options = {}
-            for mm in (all_matches if allow_reported_delete else pending_matches):
-                a = pmap.get(mm.player_a_id); b = pmap.get(mm.player_b_id) if mm.player_b_id else None
-                label = f"#{mm.id}: {a.name if a else mm.player_a_id} vs {b.name if b else 'BYE'} — result={mm.result}"
-                options[label] = mm.id
-            if options:
-                with st.form('delete_pairings_form'):
-                    sel_labels = st.multiselect("Select pairings to delete", list(options.keys()))
-                    selected_ids = [options[l] for l in sel_labels]
-                    submit_del = st.form_submit_button("Delete selected pairings")
-                if submit_del:
-                    with Session(engine) as s:
-                        for mid in selected_ids:
-                            m = s.get(Match, mid)
-                            if m is None: continue
-                            if (not allow_reported_delete) and m.result != "pending":
-                                continue
-                            s.delete(m)
-                        s.commit()
-                    invalidate_caches()
-                    st.success(f"Deleted {len(selected_ids)} pairing(s). ")
-                    st.rerun()
+            st.divider(); st.subheader("Weekly Pairings")
+            lookup = st.text_input("Look up week (DD/MM/YYYY)", value=week_str, key="lookup_pair")
+            from sqlalchemy import text as _sqltext
+            df_wk = pd.read_sql_query(
+                _sqltext(
+                    """SELECT m.id, m.player_a_id, m.player_b_id, m.result,
+                               pa.name AS a_name, pb.name AS b_name
+                        FROM matches m
+                        JOIN players pa ON pa.id = m.player_a_id
+                        LEFT JOIN players pb ON pb.id = m.player_b_id
+                        WHERE m.week = :week ORDER BY m.id"""
+                ),
+                engine, params={"week": lookup},
+            )
+            if df_wk.empty:
+                st.info("No matches for that week.")
             else:
-                st.info("No matches eligible for deletion.")
-        else:
-            st.info("No generated pairings (pending) for that week.")
+                # Derive the table, the delete labels and the pending slice from one
+                # set of vectorised columns instead of re-walking the matches
+                _has_b = df_wk["player_b_id"].notna()
+                df_wk["_a_disp"] = df_wk["a_name"] + " (#" + df_wk["player_a_id"].astype(str) + ")"
+                df_wk["_b_disp"] = (df_wk["b_name"] + " (#" + df_wk["player_b_id"].astype("Int64").astype(str) + ")").where(_has_b, "BYE")
+                df_wk["_del_label"] = (
+                    "#" + df_wk["id"].astype(str) + ": " + df_wk["a_name"] + " vs "
+                    + df_wk["b_name"].where(_has_b, "BYE") + " — result=" + df_wk["result"]
+                )
+                df_pend = df_wk[df_wk["result"] == "pending"]
+                if not df_pend.empty:
+                    disp = df_pend[["id", "_a_disp", "_b_disp", "result"]].rename(
+                        columns={"id": "Match ID", "_a_disp": "A", "_b_disp": "B", "result": "Result"}
+                    )
+                    st.dataframe(disp, use_container_width=True, hide_index=True)
+
+                    # Inline delete control for no-shows
+                    st.caption("Remove no-show pairings below. By default, only pending matches can be deleted.")
+                    allow_reported_delete = st.checkbox("Allow deleting reported results (dangerous)", value=False, key="del_allow_reported_inline")
+                    _del_src = df_wk if allow_reported_delete else df_pend
+                    options = dict(zip(_del_src["_del_label"], _del_src["id"].astype(int).tolist()))
+                    if options:
+                        with st.form('delete_pairings_form'):
+                            sel_labels = st.multiselect("Select pairings to delete", list(options.keys()))
+                            selected_ids = [options[l] for l in sel_labels]
+                            submit_del = st.form_submit_button("Delete selected pairings")
+                        if submit_del:
+                            for mid in selected_ids:
+                                m = s.get(Match, mid)
+                                if m is None: continue
+                                if (not allow_reported_delete) and m.result != "pending":
+                                    continue
+                                s.delete(m)
+                            s.commit()
+                            invalidate_caches()
+                            st.success(f"Deleted {len(selected_ids)} pairing(s). ")
+                            st.rerun()
+                    else:
+                        st.info("No matches eligible for deletion.")
+                else:
+                    st.info("No generated pairings (pending) for that week.")
 
-        st.divider(); st.subheader("Manual pairing editor (admin)")
-        st.caption("Enter a comma-separated list of player IDs to be paired in order: (1,2), (3,4), ... Use BYE token for an odd player.")
-        with Session(engine) as s:
-            eligible_ids = [p.id for p in s.exec(select(Player).where(Player.active == True).order_by(Player.name)).all()]
+            st.divider(); st.subheader("Manual pairing editor (admin)")
+            st.caption("Enter a comma-separated list of player IDs to be paired in order: (1,2), (3,4), ... Use BYE token for an odd player.")
+            active_list = active_players_snapshot(_db_version())
             attendance_ids = {r.player_id for r in s.exec(select(Attendance).where(Attendance.week == week_str)).all() if r.present}
-            eligible_ids = [i for i in eligible_ids if i in (attendance_ids if attendance_ids else set(eligible_ids))]
-            eligible_names = {}
-            for pid in eligible_ids:
-                pl = s.get(Player, pid)
-                eligible_names[pid] = f"{pl.name} (#{pl.id}, {round(pl.rating,1)})" if pl else f"#{pid}"
-        st.write("Eligible this week:")
-        if eligible_ids:
-            st.code(", ".join(f"{pid}:{eligible_names[pid]}" for pid in eligible_ids))
-        else:
-            st.info("No eligible players (check attendance).")
-        with st.form('manual_pairings_form'):
-            manual_order = st.text_input("Manual pairing order (IDs)", placeholder="e.g. 7,12,3,9,18,21 or 7,12,3 (BYE)")
-            clear_pending = st.checkbox("Clear existing pending matches for this week before applying", value=True)
-            apply_manual = st.form_submit_button("Apply manual pairings")
-        if apply_manual:
-            tokens = [t.strip().upper() for t in manual_order.split(",") if t.strip()]
-            ids: List[int] = []
-            has_bye_token = False
-            for t in tokens:
-                if t == "BYE":
-                    has_bye_token = True
-                    continue
-                if not t.isdigit():
-                    st.error(f"Invalid token: '{t}'. Use integers or 'BYE'."); break
-                ids.append(int(t))
+            eligible_ids = [p.id for p in active_list]
+            if attendance_ids:
+                eligible_ids = [i for i in eligible_ids if i in attendance_ids]
+            _by_id = {p.id: p for p in active_list}
+            eligible_names = {
+                pid: (f"{_by_id[pid].name} (#{pid}, {round(_by_id[pid].rating,1)})" if pid in _by_id else f"#{pid}")
+                for pid in eligible_ids
+            }
+            st.write("Eligible this week:")
+            if eligible_ids:
+                st.code(", ".join(f"{pid}:{eligible_names[pid]}" for pid in eligible_ids))
             else:
-                if len(ids) == 0:
-                    st.error("Please enter at least two player IDs.")
-                elif len(ids) != len(set(ids)):
-                    st.error("Duplicate IDs detected; each player can appear once.")
+                st.info("No eligible players (check attendance).")
+            with st.form('manual_pairings_form'):
+                manual_order = st.text_input("Manual pairing order (IDs)", placeholder="e.g. 7,12,3,9,18,21 or 7,12,3 (BYE)")
+                clear_pending = st.checkbox("Clear existing pending matches for this week before applying", value=True)
+                apply_manual = st.form_submit_button("Apply manual pairings")
+            if apply_manual:
+                tokens = [t.strip().upper() for t in manual_order.split(",") if t.strip()]
+                bad = next((t for t in tokens if not _PAIR_TOKEN_RE.match(t)), None)
+                if bad is not None:
+                    st.error(f"Invalid token: '{bad}'. Use integers or 'BYE'.")
                 else:
-                    with Session(engine) as s:
+                    ids = [int(t) for t in tokens if t != "BYE"]
+                    has_bye_token = "BYE" in tokens
+                    if len(ids) == 0:
+                        st.error("Please enter at least two player IDs.")
+                    elif len(ids) != len(set(ids)):
+                        st.error("Duplicate IDs detected; each player can appear once.")
+                    else:
                         if clear_pending:
-                            pend = s.exec(select(Match).where((Match.week == week_str) & (Match.result == "pending"))).all()
-                            for m in pend: s.delete(m)
-                            s.commit()
-                        created = 0
+                            s.exec(delete(Match).where((Match.week == week_str) & (Match.result == "pending")))
+                        new_matches: List[Match] = []
                         i = 0
                         while i < len(ids):
                             a = ids[i]
@@ -1153,13 +1361,18 @@ if st.session_state.get("is_admin", False) and "Pairings" in idx:
                                 i += 2
                             else:
                                 i += 1  # last one BYE
-                            m = Match(week=week_str, player_a_id=a, player_b_id=b, result="pending")
-                            s.add(m); s.commit(); created += 1
-                        st.success(f"Manual pairings applied: {created} matches created.")
+                            new_matches.append(Match(week=week_str, player_a_id=a, player_b_id=b, result="pending"))
+                        s.add_all(new_matches); s.commit()
+                        st.success(f"Manual pairings applied: {len(new_matches)} matches created.")
+
+    with T[idx["Pairings"]]:
+        _pairings_fragment()
 
 # =============== Ad-Hoc Match (admin) ===============
 if st.session_state.get("is_admin", False) and "Ad-Hoc Match" in idx:
-    with T[idx["Ad-Hoc Match"]]:
+    @st.fragment
+    def _adhoc_fragment() -> None:
+        """Admin ad-hoc match UI; widget input reruns only this fragment."""
 
         st.subheader("Ad-Hoc Match")
 
@@ -1217,26 +1430,25 @@ if st.session_state.get("is_admin", False) and "Ad-Hoc Match" in idx:
                 with Session(engine) as s3:
                     pa = s3.get(Player, pid_a)
                     pb = s3.get(Player, pid_b)
+
+                    k = 10 if k_choice2.startswith("Casual") else 40
+                    score_a = 1.0 if result2 == "a_win" else 0.0 if result2 == "b_win" else 0.5
+                    new_a, new_b = update_elo(pa.rating, pb.rating, score_a, k)
+
+                    # Insert the match fully reported; no pending row + follow-up update
                     m = Match(
                         week=adhoc_week,
                         player_a_id=pid_a,
                         player_b_id=pid_b,
-                        result="pending",
+                        result=result2,
                         a_rating_before=pa.rating, b_rating_before=pb.rating,
+                        a_rating_after=new_a, b_rating_after=new_b,
+                        k_factor_used=int(k), reported_at=datetime.utcnow(),
                         a_faction=a_faction2, b_faction=b_faction2
                     )
-                    s3.add(m); s3.commit(); s3.refresh(m)
-
-                    k = 10 if k_choice2.startswith("Casual") else 40
-                    score_a = 1.0 if result2 == "a_win" else 0.0 if result2 == "b_win" else 0.5
-                    new_a, new_b = update_elo(pa.rating, pb.rating, score_a, k)
-
-                    m.result = result2
-                    m.a_rating_after = new_a; m.b_rating_after = new_b
-                    m.k_factor_used = int(k); m.reported_at = datetime.utcnow()
                     pa.rating = new_a; pb.rating = new_b
 
-                    s3.add(pa); s3.add(pb); s3.add(m); s3.commit()
+                    s3.add_all([pa, pb, m]); s3.commit()
 
                     m_id = m.id
 
@@ -1282,3 +1494,6 @@ if st.session_state.get("is_admin", False) and "Ad-Hoc Match" in idx:
                     st.success(f"Deleted {len(ids)} match(es) and recalculated ratings.")
                     st.rerun()
 
+
+    with T[idx["Ad-Hoc Match"]]:
+        _adhoc_fragment()